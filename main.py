@@ -11,6 +11,10 @@ Options:
   --rps=<int>                  Set up RPS [default: 10].
   --alert_window_time=<float>  Alert notification time in sec [default: 30].
   --ui_time_tick=<float>       Console terminal update frequency [default: 2].
+  --lag_threshold=<int>        Enable sampling of the section stats when processing falls behind the file by N sec.
+  --sample_rate=<int>          Parse 1 in N log lines in the overload mode [default: 10].
+  --workers=<int>              Number of worker processes to parse logs, 0 parses in the main process [default: 0].
+  --history                    Read the historical file once to the end with the memory-mapped reader, can't be used with --workers and --lag_threshold [default: false].
   --hide_summary_notify        Show notify for every N seconds of log lines, display stats about the traffic during those N sec [default: false].
   --hide_alert_notify          Show notify if total traffic for the past N minutes exceeds a certain number on average [default: false].
   -X --debug                   Enable debugging logs. [default: false].
@@ -32,6 +36,10 @@ def main():
     hide_summary_notify = args["--hide_summary_notify"]
     hide_alert_notify = args["--hide_alert_notify"]
     rps = int(args["--rps"])
+    lag_threshold = int(args["--lag_threshold"]) if args["--lag_threshold"] is not None else None
+    sample_rate = int(args["--sample_rate"])
+    workers = int(args["--workers"])
+    history = args["--history"]
 
     if debug:
         logging.basicConfig(level=logging.DEBUG)
@@ -56,6 +64,10 @@ def main():
         ui_time_tick=ui_time_tick,
         hide_summary_notify=hide_summary_notify,
         hide_alert_notify=hide_alert_notify,
+        lag_threshold=lag_threshold,
+        sample_rate=sample_rate,
+        workers=workers,
+        history=history,
     )
     monitoring.run()
 
@@ -0,0 +1,66 @@
+"""Log readers benchmark.
+This script generates the test log files and measures the time of reading them with every log reader
+
+Usage:
+  benchmark.py [options]
+
+Options:
+  --rows=<int>       Number of log lines in the test files [default: 300000].
+  --rps=<int>        Approximate rps value of the test files [default: 1000].
+  --repeat=<int>     Number of runs, the best time is shown [default: 3].
+  --workers=<str>    Comma separated number of workers for the parallel reader [default: 1,2,4].
+"""
+
+import csv
+import os
+import random
+import tempfile
+import time
+
+from docopt import docopt
+from monitoring.log import Log
+from monitoring.utils import generate_test_data
+
+
+def write_test_files(folder: str, n_rows: int, rps: int):
+    """Writes the same logs in the unquoted and in the quoted (see README) format"""
+    random.seed(0)
+    data = generate_test_data(n_rows=n_rows, rps=rps)
+    files = {}
+    for name, quoting in [("unquoted", csv.QUOTE_MINIMAL), ("quoted", csv.QUOTE_NONNUMERIC)]:
+        files[name] = os.path.join(folder, f"{name}.csv")
+        with open(files[name], 'w', newline='') as file:
+            csv.writer(file, quoting=quoting).writerows(data)
+    return files
+
+
+def measure(fn, repeat: int):
+    """Returns the best wall time and the CPU time of the main process of the `repeat` runs"""
+    best_wall, best_cpu = None, None
+    for _ in range(repeat):
+        wall, cpu = time.perf_counter(), time.process_time()
+        hits = sum([window.hits for window in fn()])
+        wall, cpu = time.perf_counter() - wall, time.process_time() - cpu
+        best_wall = wall if best_wall is None else min(best_wall, wall)
+        best_cpu = cpu if best_cpu is None else min(best_cpu, cpu)
+    return hits, best_wall, best_cpu
+
+
+def start_benchmark(n_rows: int, rps: int, repeat: int, workers: list):
+    with tempfile.TemporaryDirectory() as folder:
+        for name, file_path in write_test_files(folder, n_rows, rps).items():
+            readers = [("process_log", lambda: Log.process_log(file_path, waiting_time=0)),
+                       ("process_log_mmap", lambda: Log.process_log_mmap(file_path))]
+            for n in workers:
+                readers.append((f"process_log_parallel workers={n}",
+                                lambda n=n: Log.process_log_parallel(file_path, n, waiting_time=0)))
+            for reader, fn in readers:
+                hits, wall, cpu = measure(fn, repeat)
+                print(f"{name:10} {reader:36} hits={hits} wall={wall:.2f}s main cpu={cpu:.2f}s "
+                      f"lines/s={int(hits / wall)}")
+
+
+if __name__ == "__main__":
+    args = docopt(__doc__, version='Log readers benchmark')
+    start_benchmark(int(args["--rows"]), int(args["--rps"]), int(args["--repeat"]),
+                    [int(x) for x in args["--workers"].split(",")])
@@ -1,10 +1,16 @@
 from dataclasses import dataclass
 from datetime import datetime, timedelta
+from collections import Counter, deque
+from itertools import groupby, repeat
 from time import sleep
-from typing import List
-from monitoring.errors import LogWindowError
+from typing import Deque, Dict, List, Optional
+from monitoring.errors import LogError, LogWindowError
 import logging
+import mmap
+import multiprocessing
 import csv
+import os
+import zlib
 
 LOG_HEADERS = ['remotehost', 'rfc931', 'authuser', 'time', 'api', 'status', 'bytes']
 """
@@ -31,13 +37,14 @@ class Log:
     bytes: int
 
     @classmethod
-    def parse(self, log: List):
+    def parse(self, log: List, time: Optional[datetime] = None):
+        """Parses the csv row, `time` can be passed if the timestamp of the row is already converted"""
         if log is None:
             return None
         mapping = {}
         for k, v in zip(LOG_HEADERS, log):
             if k == 'time':
-                mapping[k] = datetime.fromtimestamp(int(v))
+                mapping[k] = time if time is not None else datetime.fromtimestamp(int(v))
             elif k in ['bytes', 'status']:
                 mapping[k] = int(v)
             elif k == 'api':
@@ -48,20 +55,44 @@ class Log:
         return self(**mapping)
 
     @property
-    # A section is defined as being what's before the second '/' in the resource section of the log line.
     def section_name(self):
-        path = [c for c in self.api_url.split("/") if c]
-        return f"/{path[0]}" if path else "/"
+        return section_name(self.api_url)
 
     @property
     def has_error(self):
-        client_error = 400 <= self.status <= 451
-        server_error = 500 <= self.status <= 511
-        return client_error or server_error
+        return is_error_status(self.status)
+
+    @staticmethod
+    def newest_time(file_path: str, chunk_size: int = 4096) -> Optional[datetime]:
+        """Returns the timestamp of the last complete log line in the file without reading the whole file"""
+        with open(file_path, mode='rb') as binfile:
+            size = binfile.seek(0, os.SEEK_END)
+            binfile.seek(max(0, size - chunk_size))
+            lines = binfile.read().split(b'\n')
+        # the first line can be cut by the seek and the last one can be still written
+        for line in reversed(lines[1:-1] if size > chunk_size else lines[:-1]):
+            try:
+                row = next(csv.reader([line.decode()]))
+                return datetime.fromtimestamp(int(row[3]))
+            except (StopIteration, IndexError, ValueError, UnicodeDecodeError):
+                continue
+        return None
 
     @staticmethod
-    def process_log(file_path: str, waiting_time: int = None):
+    def process_log(file_path: str, waiting_time: int = None, lag_threshold: int = None, sample_rate: int = 10):
+        """Yields 1 sec log windows from the file.
+
+        If `lag_threshold` is set and the processed window falls behind the newest timestamp in the file
+        by more than `lag_threshold` sec, the overload mode is enabled: every line is still counted for
+        hits, bytes and errors, but only 1 in `sample_rate` lines (chosen by the hash of the line) is parsed
+        and kept in the window for the section breakdown. The mode is disabled when the lag falls to
+        `lag_threshold / 2` sec.
+        """
+        if sample_rate < 1:
+            raise ValueError('Invalid sample rate')
         window = None
+        overload = False
+        timestamp = log_time = None
         processing_start_time = datetime.now()
         with open(file_path, mode='r') as textfile:
             textfile.readline()  # skip headers
@@ -71,25 +102,309 @@ class Log:
                     row = next(gen)
                     if not row:
                         continue
-                    log_record: Log = Log.parse(row)
+                    # logs of the same second are written together, convert the timestamp once
+                    if row[3] != timestamp:
+                        timestamp = row[3]
+                        log_time = datetime.fromtimestamp(int(timestamp))
                     # need to create a new window
-                    if window and log_record.time != window.time:
+                    if window and log_time != window.time:
                         yield window
+                        if lag_threshold is not None:
+                            overload = Log.is_overloaded(file_path, window.time, lag_threshold, overload)
                         window = None
                     if window is None:
-                        window = LogWindow(log_record.time)
-                    window.push(log_record)
+                        window = LogWindow(log_time, sample_rate if overload else 1)
+                    if overload and is_skipped(row, sample_rate):
+                        window.count(log_time, int(row[5]), int(row[6]))
+                    else:
+                        window.push(Log.parse(row, log_time))
                 except StopIteration:
                     if waiting_time is not None and datetime.now() - processing_start_time > timedelta(seconds=waiting_time):
                         return
                     sleep(1.0)
 
+    @staticmethod
+    def process_log_parallel(file_path: str,
+                             workers: int,
+                             waiting_time: int = None,
+                             lag_threshold: int = None,
+                             sample_rate: int = 10,
+                             chunk_size: int = 1 << 20):
+        """Yields 1 sec log windows from the file, the same as `process_log`, but parses logs in worker processes.
+
+        The main process reads raw chunks of `chunk_size` bytes, cuts them after the last complete line and sends
+        them to the pool of `workers` processes. Every worker parses its chunk and returns only the per second
+        partial aggregates (see `aggregate_block`), the main process merges them in the file order. The last line
+        without the trailing newline is treated as still being written until `waiting_time` is over.
+        """
+        if workers < 1:
+            raise ValueError('Invalid number of workers')
+        if sample_rate < 1:
+            raise ValueError('Invalid sample rate')
+        window = None
+        overload = False
+        processing_start_time = datetime.now()
+        # results of the chunks in the file order, at most 2 chunks per worker to limit memory usage
+        pending: Deque[multiprocessing.pool.AsyncResult] = deque()
+        with multiprocessing.Pool(workers) as pool, open(file_path, mode='rb') as binfile:
+            binfile.readline()  # skip headers
+            tail = b''
+            while True:
+                chunk = binfile.read(chunk_size)
+                if chunk:
+                    # send only the complete lines, the last line can be still written
+                    data = tail + chunk
+                    cut = data.rfind(b'\n') + 1
+                    tail = data[cut:]
+                    if cut:
+                        pending.append(pool.apply_async(aggregate_block, (data[:cut], sample_rate if overload else 1)))
+                    if len(pending) < 2 * workers:
+                        continue
+                elif not pending:
+                    # all the logs are processed, wait for the new logs
+                    timeout = waiting_time is not None and datetime.now() - processing_start_time > timedelta(
+                        seconds=waiting_time)
+                    if not timeout:
+                        sleep(1.0)
+                        continue
+                    if not tail:
+                        return
+                    # no more logs are written, the last line without the trailing newline is complete
+                    pending.append(pool.apply_async(aggregate_block, (tail, sample_rate if overload else 1)))
+                    tail = b''
+                # wait for the oldest chunk, the chunks are merged in the file order
+                for partial in pending.popleft().get():
+                    if window and partial.time == window.time:
+                        window.merge(partial)
+                        continue
+                    if window:
+                        yield window
+                        if lag_threshold is not None:
+                            overload = Log.is_overloaded(file_path, window.time, lag_threshold, overload)
+                    window = partial
+
+    @staticmethod
+    def process_log_mmap(file_path: str):
+        """Yields 1 sec log windows from the historical file, reads the file once to the end (no waiting for new logs).
+
+        The file is scanned with `scan_log_columns`, windows keep only the stats and section counters, not the logs.
+        """
+        window = None
+        for timestamps, _, sections, statuses, sizes in scan_log_columns(file_path, with_host=False):
+            start = 0
+            # lines of the same second follow each other, count them at once
+            for timestamp, group in groupby(timestamps):
+                end = start + len(list(group))
+                log_time = datetime.fromtimestamp(timestamp)
+                if window and log_time != window.time:
+                    yield window
+                    window = None
+                if window is None:
+                    window = LogWindow(log_time)
+                window.count_all(log_time, statuses[start:end], sizes[start:end], sections[start:end])
+                start = end
+        if window:
+            yield window
+
+    @staticmethod
+    def is_overloaded(file_path: str, processed_time: datetime, lag_threshold: int, overload: bool) -> bool:
+        """The overload mode is enabled when the lag exceeds `lag_threshold` and disabled only when the lag falls
+        to `lag_threshold / 2`, so the lag around the threshold doesn't switch the mode every second"""
+        newest_time = Log.newest_time(file_path)
+        if newest_time is None:
+            return overload
+        lag = newest_time - processed_time
+        if overload:
+            is_overloaded = lag > timedelta(seconds=lag_threshold / 2)
+        else:
+            is_overloaded = lag > timedelta(seconds=lag_threshold)
+        if is_overloaded != overload:
+            LOGGER.info(f"Overload mode {'enabled' if is_overloaded else 'disabled'}, lag={lag}")
+        return is_overloaded
+
+
+def is_skipped(row: List[str], sample_rate: int) -> bool:
+    """In the sampled window only 1 in `sample_rate` rows is parsed, the row is chosen by crc32 of the line"""
+    return zlib.crc32(','.join(row).encode()) % sample_rate != 0
+
+
+def aggregate_block(block: bytes, sample_rate: int = 1) -> List['LogWindow']:
+    """Parses the chunk of raw log lines into the list of 1 sec windows without logs.
+
+    Runs in the worker process, the windows are small and cheap to send back to the main process.
+    """
+    windows: List[LogWindow] = []
+    for row in csv.reader(block.decode().splitlines()):
+        if not row:
+            continue
+        log_time = datetime.fromtimestamp(int(row[3]))
+        if not windows or windows[-1].time != log_time:
+            windows.append(LogWindow(log_time, sample_rate))
+        # count the row directly, without building the Log
+        skipped = sample_rate > 1 and is_skipped(row, sample_rate)
+        windows[-1].count(log_time, int(row[5]), int(row[6]), None if skipped else section_name(row[4].split(' ')[1]))
+    return windows
+
+
+def scan_log_file(file_path: str, with_host: bool = True, chunk_size: int = 1 << 20):
+    """Scans the log file mapped in memory and yields (time, remotehost, section, status, bytes) for every line.
+
+    See `scan_log_columns`, with `with_host=False` the host is None.
+    """
+    for timestamps, hosts, sections, statuses, sizes in scan_log_columns(file_path, with_host, chunk_size):
+        times = {timestamp: datetime.fromtimestamp(timestamp) for timestamp in set(timestamps)}
+        yield from zip(map(times.__getitem__, timestamps), hosts or repeat(None), sections, statuses, sizes)
+
+
+def scan_log_columns(file_path: str, with_host: bool = True, chunk_size: int = 1 << 20):
+    """Scans the log file mapped in memory by chunks of about `chunk_size` bytes.
+
+    For every chunk yields the columns (timestamps, hosts, sections, statuses, bytes) of its lines, hosts is None
+    with `with_host=False`. The whole chunk is split into the fields at once, numeric fields are converted with
+    `map(int, ...)` and the host and the section are decoded once per distinct value in the chunk.
+    Quoted fields are unquoted, the chunk with commas or escaped quotes inside the quotes falls back to the csv module.
+    """
+    with open(file_path, mode='rb') as binfile:
+        if os.fstat(binfile.fileno()).st_size == 0:
+            return
+        with mmap.mmap(binfile.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            start = mm.find(b'\n') + 1  # skip headers
+            size = len(mm)
+            while 0 < start < size:
+                end = mm.find(b'\n', min(start + chunk_size, size) - 1)
+                end = size if end == -1 else end + 1
+                chunk = mm[start:end]
+                start = end
+                yield parse_chunk(chunk if chunk.endswith(b'\n') else chunk + b'\n', with_host)
+
+
+def parse_chunk(chunk: bytes, with_host: bool = True):
+    """Parses the complete log lines into the columns (timestamps, hosts, sections, statuses, bytes)"""
+    if b'\r' in chunk:
+        chunk = chunk.replace(b'\r\n', b'\n')
+    fields = None
+    # escaped quotes (e.g. /a""b) can't be unquoted by removing the quotes
+    if b'""' not in chunk:
+        data = chunk.replace(b'"', b'') if b'"' in chunk else chunk
+        fields = data[:-1].replace(b'\n', b',').split(b',')
+        # commas inside the quotes or empty lines change the number of fields
+        if len(fields) != chunk.count(b'\n') * len(LOG_HEADERS):
+            fields = None
+    if fields is None:
+        fields = []
+        for row in csv.reader(chunk.decode().splitlines()):
+            if not row:
+                continue
+            if len(row) != len(LOG_HEADERS):
+                raise LogError(f"Invalid log line: {row}")
+            fields.extend([field.encode() for field in row])
+
+    step = len(LOG_HEADERS)
+    requests = fields[4::step]
+    sections = {request: request_section(request) for request in set(requests)}
+    hosts = None
+    if with_host:
+        hosts = fields[0::step]
+        names = {host: host.decode() for host in set(hosts)}
+        hosts = list(map(names.__getitem__, hosts))
+    return (list(map(int, fields[3::step])), hosts, list(map(sections.__getitem__, requests)),
+            list(map(int, fields[5::step])), list(map(int, fields[6::step])))
+
+
+def request_section(request: bytes) -> str:
+    """Returns the section name of the raw request field, e.g. b'GET /api/user HTTP/1.0' -> '/api'"""
+    parts = request.decode().split(' ')
+    if len(parts) < 2:
+        raise LogError(f"Invalid request: {request}")
+    return section_name(parts[1])
+
+
+def section_name(api_url: str) -> str:
+    # A section is defined as being what's before the second '/' in the resource section of the log line.
+    path = [c for c in api_url.split("/") if c]
+    return f"/{path[0]}" if path else "/"
+
+
+def is_error_status(status: int) -> bool:
+    client_error = 400 <= status <= 451
+    server_error = 500 <= status <= 511
+    return client_error or server_error
+
+
 class LogWindow:
-    def __init__(self, time: datetime) -> None:
+    """1 sec window of logs.
+
+    `hits`, `total_bytes` and `errors` are exact and count every log line. `items` keeps only the parsed
+    logs, with `sample_rate` > 1 only 1 in `sample_rate` lines is kept (the window is sampled).
+    Lines without the parsed log are only counted in the `counted_*` stats, `counted_sections` holds their
+    hits per section. `sections` is scaled by `sample_rate` for the sampled window.
+    """
+    def __init__(self, time: datetime, sample_rate: int = 1) -> None:
         self.time = time
+        self.sample_rate = sample_rate
         self.items: List[Log] = []
+        self.counted_sections: Dict[str, int] = Counter()
+        self.counted_hits = 0
+        self.counted_bytes = 0
+        self.counted_errors = 0
+
+    @property
+    def sampled(self):
+        return self.sample_rate > 1
+
+    @property
+    def hits(self):
+        return len(self.items) + self.counted_hits
+
+    @property
+    def total_bytes(self):
+        return sum([log.bytes for log in self.items]) + self.counted_bytes
+
+    @property
+    def errors(self):
+        return len([log for log in self.items if log.has_error]) + self.counted_errors
+
+    @property
+    def sections(self):
+        sections = Counter(self.counted_sections)
+        for log in self.items:
+            sections[log.section_name] += self.sample_rate
+        return sections
+
+    def count(self, time: datetime, status: int, bytes: int, section: Optional[str] = None):
+        """Counts the log line without storing it"""
+        if time != self.time:
+            raise LogWindowError("Adding error, need to create a new window log")
+        self.counted_hits += 1
+        self.counted_bytes += bytes
+        self.counted_errors += is_error_status(status)
+        if section is not None:
+            self.counted_sections[section] += self.sample_rate
+
+    def count_all(self, time: datetime, statuses: List[int], sizes: List[int], sections: List[str]):
+        """Counts the log lines of the same second given by their columns without storing them"""
+        if time != self.time:
+            raise LogWindowError("Adding error, need to create a new window log")
+        self.counted_hits += len(statuses)
+        self.counted_bytes += sum(sizes)
+        self.counted_errors += sum([n for status, n in Counter(statuses).items() if is_error_status(status)])
+        for section, n in Counter(sections).items():
+            self.counted_sections[section] += n * self.sample_rate
 
     def push(self, log: Log):
         if log.time != self.time:
             raise LogWindowError("Adding error, need to create a new window log")
         self.items.append(log)
+
+    def merge(self, window: 'LogWindow'):
+        """Merges the partial window of the same second"""
+        if window.time != self.time:
+            raise LogWindowError("Merging error, windows have different time")
+        if window.items and window.sample_rate != self.sample_rate:
+            raise LogWindowError("Merging error, windows with logs have different sample rate")
+        self.sample_rate = max(self.sample_rate, window.sample_rate)
+        self.items.extend(window.items)
+        self.counted_sections.update(window.counted_sections)
+        self.counted_hits += window.counted_hits
+        self.counted_bytes += window.counted_bytes
+        self.counted_errors += window.counted_errors
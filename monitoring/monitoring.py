@@ -8,7 +8,7 @@ import logging
 
 from monitoring.log import Log, LogWindow
 from monitoring.timeline import TimeLine
-from itertools import groupby
+from collections import Counter, defaultdict
 from rich.console import Console
 from rich.table import Table
 from typing import Any
@@ -27,6 +27,8 @@ class Summary:
     top_k: List[Any]
     start_time: datetime
     end_time: datetime
+    # top_k is scaled from sampled logs
+    estimated: bool = False
 
 
 @dataclass
@@ -61,14 +63,18 @@ class AbstractNotification(ABC):
         raise NotImplemented("This method should be overridden")
 
     def group_by_section(self):
-        fn = lambda log: log.section_name
         queue = self.timeline.queue
-        log_list = []
+        logs = defaultdict(list)
+        hits = Counter()
         for x in queue:
-            log_list.extend([xx for xx in x.items])
-        sorted_list = sorted(log_list, key=lambda log: log.section_name)
-        sorted_list = {k: list(v) for k, v in groupby(sorted_list, key=fn)}
-        return [SectionStat(name=name, hits=len(logs), logs=logs) for name, logs in sorted_list.items()]
+            # windows aggregated in the worker processes have only the section counters
+            hits.update(x.counted_sections)
+            for log in x.items:
+                name = log.section_name
+                logs[name].append(log)
+                # every sampled log stands for `sample_rate` logs
+                hits[name] += x.sample_rate
+        return [SectionStat(name=name, hits=count, logs=logs[name]) for name, count in sorted(hits.items())]
 
     def top_k(self, limit: int):
         sections = self.group_by_section()
@@ -96,25 +102,24 @@ class SummaryNotification(AbstractNotification):
 
     def update_stats(self):
         queue = self.timeline.queue
-        if not queue:
+        windows = [x for x in queue if x.hits]
+        if not windows:
             return
-        log_list = []
-        for x in queue:
-            log_list.extend(x.items)
 
-        hits = len(log_list)
-        total_bytes = sum([log.bytes for log in log_list])
-        errors = len([log for log in log_list if log.has_error])
+        hits = sum([x.hits for x in windows])
+        total_bytes = sum([x.total_bytes for x in windows])
+        errors = sum([x.errors for x in windows])
         error_percentage = 0 if not hits else round((errors / hits) * 100, 2)
-        start_time = log_list[0].time
+        start_time = windows[0].time
         end_time = start_time + self.window_size
-        self.notification = Summary(hits=len(log_list),
+        self.notification = Summary(hits=hits,
                                     total_bytes=total_bytes,
                                     errors=errors,
                                     error_percentage=error_percentage,
                                     top_k=self.top_k(10),
                                     start_time=start_time,
-                                    end_time=end_time)
+                                    end_time=end_time,
+                                    estimated=any([x.sampled for x in windows]))
 
 
 class AlertNotification(AbstractNotification):
@@ -152,7 +157,7 @@ class AlertNotification(AbstractNotification):
         if not queue:
             return
         seconds = int(self.window_size.total_seconds())
-        rps = round(sum([len(x.items) for x in queue]) / seconds, 2)
+        rps = round(sum([x.hits for x in queue]) / seconds, 2)
         active_error = self.active_error
         # if process recovered
         if rps < self.threshold:
@@ -174,8 +179,19 @@ class Monitoring:
         hide_alert_notify: bool,
         hide_summary_notify: bool,
         ui_time_tick: int,
+        lag_threshold: Optional[int] = None,
+        sample_rate: int = 10,
+        workers: int = 0,
+        history: bool = False,
     ) -> None:
+        if history and (workers or lag_threshold is not None):
+            raise ValueError('The history mode reads the file in the main process without sampling, '
+                             'it can not be used with workers or lag threshold')
         self.file_path = file_path
+        self.history = history
+        self.workers = workers
+        self.lag_threshold = lag_threshold
+        self.sample_rate = sample_rate
         self.ui_time_tick = ui_time_tick
         self.hide_summary_notify = hide_summary_notify
         self.hide_alert_notify = hide_alert_notify
@@ -192,14 +208,28 @@ class Monitoring:
 
     def run(self) -> None:
         try:
-            it = Log.process_log(self.file_path)
-            while True:
-                # window - contains the RPS
-                window = next(it)
-                logger.debug((window.time, len(window.items)))
+            if self.history:
+                it = Log.process_log_mmap(self.file_path)
+            elif self.workers:
+                it = Log.process_log_parallel(self.file_path,
+                                              self.workers,
+                                              lag_threshold=self.lag_threshold,
+                                              sample_rate=self.sample_rate)
+            else:
+                it = Log.process_log(self.file_path, lag_threshold=self.lag_threshold, sample_rate=self.sample_rate)
+            # window - contains the RPS
+            for window in it:
+                logger.debug((window.time, window.hits, window.sample_rate))
                 self.update_terminal(window)
-                # timeout(blocking operation)
-                sleep(self.ui_time_tick)                
+                # the historical file is processed without throttling
+                if not self.history:
+                    # timeout(blocking operation)
+                    sleep(self.ui_time_tick)
+            if self.history:
+                # the end of the file, show the stats of the last windows
+                self.summary.update_stats()
+                self.alert.update_stats()
+                self.show_notifications()
         except KeyboardInterrupt:
             print('Monitoring has been stopped!')
 
@@ -207,6 +237,9 @@ class Monitoring:
         # received new logs need to update the summary and alert stats
         self.summary.update(window)
         self.alert.update(window)
+        self.show_notifications()
+
+    def show_notifications(self) -> None:
         summary = self.summary
         alert = self.alert
         if summary.has_notification and not self.hide_summary_notify:
@@ -232,7 +265,10 @@ class Monitoring:
                       str(summary.errors), str(summary.error_percentage))
         console.print(table)
 
-        table = Table(title="Top 10 section by hit rate")
+        title = "Top 10 section by hit rate"
+        if summary.estimated:
+            title += " (estimated, overload sampling)"
+        table = Table(title=title)
         table.add_column("Name", style="magenta")
         table.add_column("Hit rate", style="magenta")
         for x in summary.top_k:
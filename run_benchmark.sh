@@ -0,0 +1,2 @@
+#!/usr/bin/env bash
+python -m monitoring.benchmark --rows 300000 --workers 1,2,4
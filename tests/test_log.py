@@ -1,5 +1,6 @@
-from datetime import datetime
-from monitoring.log import Log
+from datetime import datetime, timedelta
+import csv
+from monitoring.log import Log, scan_log_file
 import logging
 
 LOGGER = logging.getLogger(__name__)
@@ -49,4 +50,81 @@ def test_parsing_error_status():
     assert log.has_error == True
 
     log.status = 500
-    assert log.has_error == True
\ No newline at end of file
+    assert log.has_error == True
+
+def test_newest_time():
+    assert Log.newest_time('./tests/mock.csv') == datetime.fromtimestamp(1549573902)
+    assert Log.newest_time('./tests/mock.csv', chunk_size=64) == datetime.fromtimestamp(1549573902)
+
+
+def test_scan_log_file(tmp_path):
+    file_path = tmp_path / "quoted.csv"
+    file_path.write_text('"remotehost","rfc931","authuser","date","request","status","bytes"\r\n'
+                         '"10.0.0.1","-","apache",1549574332,"GET /api/user HTTP/1.0",200,1234\r\n'
+                         '"10.0.0.4","-","apache, inc",1549574333,"GET /report HTTP/1.0",404,1136\r\n'
+                         '"10.0.0.1","-","apache",1549574334,"GET / HTTP/1.0",500,1194\r\n'
+                         '"10.0.0.1","-","apache",1549574334,"GET /a""b HTTP/1.0",200,1\n'
+                         '10.0.0.2,-,apache,1549574335,GET //help/me?x=1 HTTP/1.0,200,2\n'
+                         '10.0.0.2,-,apache,1549574335,GET report HTTP/1.0,200,3')
+    # the whole file is one chunk parsed by the csv module, with chunk_size=1 every line is a chunk
+    # and the lines without commas or escaped quotes inside the quotes are unquoted
+    assert list(scan_log_file(str(file_path))) == list(scan_log_file(str(file_path), chunk_size=1)) == [
+        (datetime.fromtimestamp(1549574332), "10.0.0.1", "/api", 200, 1234),
+        (datetime.fromtimestamp(1549574333), "10.0.0.4", "/report", 404, 1136),
+        (datetime.fromtimestamp(1549574334), "10.0.0.1", "/", 500, 1194),
+        (datetime.fromtimestamp(1549574334), "10.0.0.1", '/a"b', 200, 1),
+        (datetime.fromtimestamp(1549574335), "10.0.0.2", "/help", 200, 2),
+        (datetime.fromtimestamp(1549574335), "10.0.0.2", "/report", 200, 3),
+    ]
+    # the same sections as in the csv reader
+    with open(file_path, newline='') as textfile:
+        textfile.readline()
+        assert [x[2] for x in scan_log_file(str(file_path), with_host=False)] == [
+            Log.parse(row).section_name for row in csv.reader(textfile)
+        ]
+
+
+def test_process_log_mmap():
+    windows = list(Log.process_log_mmap('./tests/mock.csv'))
+    expected = Log.process_log('./tests/mock.csv', waiting_time=2)
+    assert [(x.time, x.hits, x.total_bytes, x.errors, x.sections) for x in windows[:-1]] == [
+        (x.time, x.hits, x.total_bytes, x.errors, x.sections) for x in expected
+    ]
+    # the historical file is read to the end, the last window is yielded too
+    assert windows[-1].time == datetime.fromtimestamp(1549573902)
+    assert windows[-1].hits == 1
+
+
+def test_process_log_parallel():
+    windows = list(Log.process_log_parallel('./tests/mock.csv', workers=2, waiting_time=2, chunk_size=64))
+    assert [(x.time, x.hits, x.total_bytes, x.errors) for x in windows] == [
+        (x.time, x.hits, x.total_bytes, x.errors) for x in Log.process_log('./tests/mock.csv', waiting_time=2)
+    ]
+    assert windows[0].hits == 3
+    assert windows[0].sections == {"/api": 3}
+    assert windows[0].items == []
+    assert windows[1].hits == 2
+    assert windows[1].errors == 2
+    assert windows[2].sections == {"/help": 2}
+
+
+def test_process_log_parallel_last_line(tmp_path):
+    file_path = tmp_path / "no_newline.csv"
+    file_path.write_text(open('./tests/mock.csv').read().rstrip('\n'))
+    windows = list(Log.process_log_parallel(str(file_path), workers=2, waiting_time=0, chunk_size=64))
+    # the last line is flushed on timeout, the second to last window is yielded as in `process_log`
+    assert [(x.time, x.hits) for x in windows] == [
+        (x.time, x.hits) for x in Log.process_log(str(file_path), waiting_time=0)
+    ]
+    assert windows[-1].time == datetime.fromtimestamp(1549573901)
+
+
+def test_is_overloaded_hysteresis():
+    newest_time = datetime.fromtimestamp(1549573902)
+    # enabled above the threshold
+    assert Log.is_overloaded('./tests/mock.csv', newest_time - timedelta(seconds=10), 10, False) == False
+    assert Log.is_overloaded('./tests/mock.csv', newest_time - timedelta(seconds=11), 10, False) == True
+    # disabled only at the half of the threshold
+    assert Log.is_overloaded('./tests/mock.csv', newest_time - timedelta(seconds=10), 10, True) == True
+    assert Log.is_overloaded('./tests/mock.csv', newest_time - timedelta(seconds=6), 10, True) == True
+    assert Log.is_overloaded('./tests/mock.csv', newest_time - timedelta(seconds=5), 10, True) == False
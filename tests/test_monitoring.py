@@ -1,7 +1,8 @@
-from datetime import timedelta
+from datetime import datetime, timedelta
 from monitoring.log import Log
 from monitoring.monitoring import Monitoring
 import logging
+import pytest
 
 
 LOGGER = logging.getLogger(__name__)
@@ -119,3 +120,95 @@ def test_monitoring_summary_and_alert():
     error = monitoring.alert.errors[-1]
     assert error.rps == 5
     assert error.recover_at is not None
+
+
+def test_monitoring_overload_sampling():
+    monitoring = Monitoring(
+        file_path='',
+        rps=2,
+        summary_window_time=timedelta(seconds=1),
+        alert_window_time=timedelta(seconds=1),
+        ui_time_tick=0,
+        hide_summary_notify=True,
+        hide_alert_notify=True,
+    )
+
+    # the newest log is 41 sec ahead of the first window, the overload mode starts from the second window
+    it = Log.process_log('./tests/mock.csv', waiting_time=2, lag_threshold=5, sample_rate=2)
+    window = next(it)
+    assert window.sampled == False
+    assert window.hits == 3
+    assert len(window.items) == 3
+    monitoring.summary.update(window)
+    monitoring.alert.update(window)
+
+    window = next(it)
+    assert window.sampled == True
+    assert window.hits == 2
+    assert window.errors == 2
+    # both lines of the window are equal and have the same crc32, both are skipped
+    assert len(window.items) == 0
+    assert window.sections == {}
+    monitoring.summary.update(window)
+    monitoring.alert.update(window)
+
+    window = next(it)
+    assert window.sampled == True
+    assert window.hits == 2
+    assert len(window.items) == 0
+    monitoring.summary.update(window)
+    monitoring.alert.update(window)
+
+    # hits, errors and rps are exact, only the section stats are estimated
+    summary = monitoring.summary.notification
+    assert summary.estimated == True
+    assert summary.hits == 5
+    assert summary.errors == 2
+    assert [(x.name, x.hits) for x in summary.top_k] == [("/api", 3)]
+
+    error = monitoring.alert.errors[-1]
+    assert error.rps == 5
+
+    # the sampled log stands for `sample_rate` logs
+    window = next(it)
+    assert window.sampled == True
+    assert window.hits == 1
+    assert len(window.items) == 1
+    assert window.sections == {"/hello": 2}
+
+
+def test_monitoring_history():
+    monitoring = Monitoring(
+        file_path='./tests/mock.csv',
+        rps=1,
+        summary_window_time=timedelta(seconds=10),
+        alert_window_time=timedelta(seconds=10),
+        ui_time_tick=2,
+        hide_summary_notify=True,
+        hide_alert_notify=True,
+        history=True,
+    )
+    # the file is read once without waiting ui_time_tick between the windows
+    monitoring.run()
+
+    # the stats of the last windows are updated at the end of the file
+    summary = monitoring.summary.notification
+    assert summary.hits == 3
+    assert summary.start_time == datetime.fromtimestamp(1549573899)
+    assert [(x.name, x.hits) for x in summary.top_k] == [("/last", 3)]
+    assert monitoring.alert.has_notification == False
+
+
+def test_monitoring_history_options():
+    with pytest.raises(ValueError):
+        Monitoring(
+            file_path='./tests/mock.csv',
+            rps=1,
+            summary_window_time=timedelta(seconds=10),
+            alert_window_time=timedelta(seconds=10),
+            ui_time_tick=0,
+            hide_summary_notify=True,
+            hide_alert_notify=True,
+            workers=2,
+            history=True,
+        )